@@ -1,19 +1,18 @@
-import sys
-import json
 import logging
 import unicodedata
 import asyncio
+import functools
+import os
 import aiohttp
-import contextlib
-from datetime import datetime
-from urllib.parse import urlparse, urljoin
+from collections import OrderedDict
+from datetime import datetime, timezone
 from bs4 import BeautifulSoup
-from slimit.parser import Parser
-from slimit.visitors import nodevisitor
-from slimit import ast
 from sqlalchemy_utils import Currency
-import dateutil.parser
 import re
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
 from auction_scraper.abstract_scraper import AbstractAuctionScraper, SearchResult
 from auction_scraper.scrapers.ebay.models import EbayAuction, EbayProfile
@@ -22,31 +21,64 @@ from auction_scraper.scrapers.ebay.models import EbayAuction, EbayProfile
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Caching mechanism for improved performance on repetitive data access
-class SimpleCache:
-    def __init__(self):
-        self._cache = {}
+# Size-bounded cache, evicting the least recently used entry when full
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
 
     def get(self, key):
-        return self._cache.get(key)
+        try:
+            self._cache.move_to_end(key)
+        except KeyError:
+            return None
+        return self._cache[key]
 
     def set(self, key, value):
         self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
 
     def clear(self):
         self._cache.clear()
 
-cache = SimpleCache()
+cache = LRUCache(maxsize=256)
+
+# Matches the seller name in a /usr/{name} profile uri
+_PROFILE_RE = re.compile(r'/usr/([^/?#]+)')
+# Marker for inline scripts carrying the auction's embedded JSON
+_RWIDGETS_MARKER = re.compile(r'\$rwidgets')
+# Matches the argument list of each $rwidgets(...) call in an inline script,
+# stepping over quoted strings so a ");" inside a value does not end it
+_RWIDGETS_CALL = re.compile(
+    r'\$rwidgets\s*\(((?:"(?:\\.|[^"\\])*"|[^"])*?)\)\s*;', re.S)
+# Matches a "key": value pair whose value is a JSON scalar literal
+_KV = re.compile(r'"([A-Za-z0-9_]+)"\s*:\s*("(?:\\.|[^"\\])*"|true|false|null|-?\d+(?:\.\d+)?)')
 
-@contextlib.contextmanager
-def silence_output():
-    """Suppress unwanted parser output during JS parsing with slimit."""
-    save_stdout, save_stderr = sys.stdout, sys.stderr
-    sys.stdout, sys.stderr = open(sys.devnull, 'w'), open(sys.devnull, 'w')
+@functools.lru_cache(maxsize=256)
+def _make_currency(currency_code):
+    """
+    Returns the Currency for currency_code, or None if it is invalid.
+    Memoised, since Currency validates the code on every construction.
+    """
     try:
-        yield
-    finally:
-        sys.stdout, sys.stderr = save_stdout, save_stderr
+        return Currency(currency_code)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error parsing currency: {currency_code} - {e}")
+        return None
+
+def _open_disk_cache(cache_path, size_limit):
+    """
+    Opens the persistent auction cache in the directory cache_path.
+    """
+    try:
+        import diskcache
+    except ImportError as e:
+        raise ImportError('cache_path requires the diskcache package; '
+            'install auction-scraper with the diskcache extra') from e
+    return diskcache.Cache(os.path.expanduser(cache_path),
+        size_limit=size_limit, eviction_policy='least-recently-used')
 
 class EbayAuctionScraper(AbstractAuctionScraper):
     """
@@ -61,71 +93,177 @@ class EbayAuctionScraper(AbstractAuctionScraper):
     backend_name = 'ebay'
     auction_duplicates = ['maxImageUrl', 'displayImgUrl']
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db_path, *args, cache_path=None,
+            cache_size_limit=2**28, **kwargs):
+        """
+        If cache_path is given, auctions that have ended are persisted in a
+        disk cache in that directory, keyed by uri, and later runs reuse
+        them instead of refetching the page.  Live auctions are always
+        refetched, as their prices and bids still change.  The cache is
+        held to cache_size_limit bytes by evicting the least recently used
+        auctions, and may be shared by concurrent processes.
+        Requires the diskcache extra.
+        """
+        super().__init__(db_path, *args, **kwargs)
+        self._session = None
+
+        self._disk_cache = None
+        if cache_path is not None:
+            self._disk_cache = _open_disk_cache(cache_path, cache_size_limit)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _ensure_session(self):
+        """
+        Returns the shared ClientSession, creating it on first use so that
+        connections are kept alive and reused across requests.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300))
+        return self._session
+
+    async def close(self):
+        """Closes the shared ClientSession and the disk cache, if open."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._disk_cache is not None:
+            self._disk_cache.close()
+            self._disk_cache = None
 
     async def _get_page(self, uri):
         """
         Fetches and parses a page asynchronously.
+        Returns a tuple (soup, html) of the parsed page and its raw HTML.
         """
         cache_key = f"page:{uri}"
         cached_content = cache.get(cache_key)
-        if cached_content:
+        if cached_content is not None:
             logger.debug(f"Cache hit for URI: {uri}")
-            return cached_content
-
-        async with aiohttp.ClientSession() as session:
+            raw, encoding, from_encoding = cached_content
+        else:
+            session = await self._ensure_session()
             async with session.get(uri) as response:
-                html_content = await response.text()
-                soup = BeautifulSoup(html_content, 'html.parser')
-                cache.set(cache_key, soup)
-                return soup
+                raw = await response.read()
+                # The declared charset if Python recognises it, else UTF-8
+                encoding = response.get_encoding()
+                # Only override lxml's own detection from the page's meta
+                # tags when the server actually declared a charset
+                from_encoding = encoding \
+                    if response.charset is not None else None
+            cache.set(cache_key, (raw, encoding, from_encoding))
+
+        # Hand lxml the undecoded bytes rather than decoding them first.
+        # Parse in a worker thread so the event loop keeps serving requests
+        loop = asyncio.get_running_loop()
+        soup = await loop.run_in_executor(None, functools.partial(
+            BeautifulSoup, raw, 'lxml', from_encoding=from_encoding))
+        return soup, raw.decode(encoding, errors='replace')
 
     async def _scrape_auction_page(self, uri):
-        soup = await self._get_page(uri)
-        auction = self.__parse_auction_soup(soup)
+        # Ended auctions persisted by an earlier run need not be fetched
+        # again.  The disk cache blocks on SQLite, so keep it off the loop
+        loop = asyncio.get_running_loop()
+        cached = None
+        if self._disk_cache is not None:
+            cached = await loop.run_in_executor(
+                None, self._disk_cache.get, uri)
+        if cached is not None:
+            logger.debug(f"Disk cache hit for URI: {uri}")
+            raw_values, description, html = cached
+        else:
+            soup, html = await self._get_page(uri)
+
+            # The embedded JSON is cached by the auction's uri
+            cache_key = f"json:{uri}"
+            raw_values = cache.get(cache_key)
+            if raw_values is not None:
+                logger.debug("Using cached JSON data")
+            else:
+                raw_values = await loop.run_in_executor(
+                    None, self.__get_embedded_json, soup)
+                cache.set(cache_key, raw_values)
+
+            description = self.__extract_description(soup)
+
+        auction = self.__parse_auction_values(raw_values, description)
         auction.uri = uri
-        return auction, soup.prettify()
+
+        # Only ended auctions are persisted, as their values are final
+        ended = auction.end_time is not None and \
+            auction.end_time <= datetime.now(timezone.utc).replace(tzinfo=None)
+        if cached is None and self._disk_cache is not None and ended:
+            await loop.run_in_executor(None, self._disk_cache.set,
+                uri, (raw_values, description, html))
+        return auction, html
+
+    async def scrape_many_auctions(self, uris, concurrency=16):
+        """
+        Scrapes the auction pages at uris concurrently over the shared
+        session, with at most concurrency requests in flight.
+        Returns a list of (auction, html) tuples in the order of uris.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def scrape_one(uri):
+            async with semaphore:
+                return await self._scrape_auction_page(uri)
+
+        return await asyncio.gather(*(scrape_one(uri) for uri in uris))
 
     async def _scrape_profile_page(self, uri):
-        profile_id = urlparse(uri).path.split('/')[2]
-        soup = await self._get_page(uri)
+        match = _PROFILE_RE.search(uri)
+        if match is None:
+            raise ValueError(f'Could not find a profile ID in uri {uri}')
+        profile_id = match.group(1)
+        soup, html = await self._get_page(uri)
         profile = self.__parse_profile_soup(soup, profile_id)
         profile.uri = uri
-        return profile, soup.prettify()
+        return profile, html
 
     async def _scrape_search_page(self, uri):
-        soup = await self._get_page(uri)
-        return self.__parse_search_soup(soup), soup.prettify()
+        soup, html = await self._get_page(uri)
+        return self.__parse_search_soup(soup), html
 
     def __get_dict_value(self, dictionary, key, default=None):
-        """Retrieve and convert values from dictionary with error handling."""
+        """
+        Retrieve a value from dictionary, converting scalars the page quoted
+        as strings (such as "3" or "true") to their Python values.
+        """
         value = dictionary.get(key, default)
+        if not isinstance(value, str):
+            return value
         if value == 'true':
             return True
         if value == 'false':
             return False
-        if value in ('null', None):
+        if value == 'null':
             return None
         try:
             return int(value)
-        except (ValueError, TypeError):
+        except ValueError:
             pass
         try:
             return float(value)
-        except (ValueError, TypeError):
+        except ValueError:
             pass
         return value
 
-    def __parse_auction_soup(self, soup):
+    def __parse_auction_values(self, raw_values, description):
         """
-        Parses auction details from the page soup.
+        Builds an auction from the page's embedded JSON and description.
         """
-        raw_values = self.__get_embedded_json(soup)
-
         auction = EbayAuction(id=int(raw_values.get('itemId', 0)))
-        auction.title = unicodedata.normalize("NFKD", raw_values.get('it', ''))
-        auction.description = self.__extract_description(soup)
+        title = raw_values.get('it') or ''
+        # ASCII titles are already NFKD-normalised
+        auction.title = title if title.isascii() \
+            else unicodedata.normalize("NFKD", title)
+        auction.description = description
         auction.seller_id = raw_values.get('entityName', '')
 
         auction.start_time = self.__parse_timestamp(raw_values.get('startTime'))
@@ -139,7 +277,7 @@ class EbayAuctionScraper(AbstractAuctionScraper):
         auction.locale = raw_values.get('locale', '')
         auction.quantity = self.__get_dict_value(raw_values, 'totalQty', 1)
         auction.video_url = raw_values.get('videoUrl', '')
-        auction.vat_included = raw_values.get('vatIncluded') == 'true'
+        auction.vat_included = raw_values.get('vatIncluded') in (True, 'true')
         auction.domain = raw_values.get('currentDomain', '')
 
         return auction
@@ -148,68 +286,68 @@ class EbayAuctionScraper(AbstractAuctionScraper):
         """
         Extracts embedded JSON from JavaScript within the HTML.
         """
-        cache_key = f"json:{soup}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            logger.debug("Using cached JSON data")
-            return cached_data
-
         raw_values = {}
-        with silence_output():
-            parser = Parser()
-        for script in soup.find_all('script', src=None):
-            script_text = ''.join(script.contents)
-            if '$rwidgets' in script_text:
-                tree = parser.parse(script_text)
-                for node in nodevisitor.visit(tree):
-                    if isinstance(node, ast.FunctionCall) and node.identifier.value == '$rwidgets':
-                        fields = {}
-                        for n in nodevisitor.visit(node):
-                            if isinstance(n, ast.Assign):
-                                k = getattr(n.left, 'value', '').strip('"')
-                                v = getattr(n.right, 'value', '').strip('"')
-                                if k in self.auction_duplicates:
-                                    fields.setdefault(k, []).append(v)
-                                else:
-                                    fields[k] = v
-                        for k, v in fields.items():
-                            if k in self.auction_duplicates:
-                                raw_values.setdefault(k, []).extend(v)
-                            else:
-                                raw_values[k] = v
-        cache.set(cache_key, raw_values)
+        for script in soup.find_all('script', src=None, string=_RWIDGETS_MARKER):
+            script_text = script.string or ''.join(script.contents)
+            for call in _RWIDGETS_CALL.finditer(script_text):
+                pairs = _KV.findall(call.group(1))
+                if not pairs:
+                    continue
+                keys, literals = zip(*pairs)
+                for k, v in zip(keys, self.__decode_literals(literals)):
+                    if k in self.auction_duplicates:
+                        raw_values.setdefault(k, []).append(v)
+                    else:
+                        raw_values[k] = v
         return raw_values
 
+    def __decode_literals(self, literals):
+        """
+        Decodes a sequence of JSON scalar literals with a single loads call,
+        falling back to decoding them one at a time if any is invalid.
+        """
+        try:
+            return _json.loads('[' + ','.join(literals) + ']')
+        except ValueError:
+            pass
+
+        values = []
+        for literal in literals:
+            try:
+                values.append(_json.loads(literal))
+            except ValueError:
+                # JS that is not valid JSON, such as \x escapes or a number
+                # with a leading zero; keep the raw text
+                values.append(literal[1:-1] if literal.startswith('"') \
+                    else literal)
+        return values
+
     def __get_image_urls(self, raw_values):
-        """Retrieve and decode image URLs from embedded JSON."""
+        """Retrieve image URLs from embedded JSON."""
         max_images = raw_values.get('maxImageUrl', [])
         display_images = raw_values.get('displayImgUrl', [])
         return [
-            json.loads(f'"{max_img if max_img != "null" else disp_img}"')
+            max_img if max_img is not None else disp_img
             for max_img, disp_img in zip(max_images, display_images) if max_img or disp_img
         ]
 
     def __parse_timestamp(self, timestamp):
-        """Converts a timestamp string to a datetime object."""
+        """Converts a millisecond epoch timestamp to a UTC datetime object."""
         try:
-            return datetime.utcfromtimestamp(int(timestamp) / 1000)
+            # Naive UTC, matching the other scrapers' DateTime columns
+            return datetime.fromtimestamp(int(timestamp) // 1000, tz=timezone.utc) \
+                .replace(tzinfo=None)
         except (TypeError, ValueError) as e:
             logger.error(f"Error parsing timestamp: {timestamp} - {e}")
             return None
 
     def __parse_currency(self, currency_code):
         """Parses currency code to Currency object with error handling."""
-        try:
-            return Currency(currency_code)
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing currency: {currency_code} - {e}")
-            return None
+        return _make_currency(currency_code)
 
     def __extract_description(self, soup):
         """Extract description content from HTML soup."""
-        desc_div = soup.find('div', id='desc_div')
-        if desc_div and desc_div.find('iframe'):
-            return desc_div.find('iframe').get_text(strip=True)
-        desc_holder = soup.find('div', class_='vi_descsnpt_holder')
-        return desc_holder.get_text(strip=True) if desc_holder else ''
+        node = soup.select_one('#desc_div iframe') or \
+            soup.select_one('div.vi_descsnpt_holder')
+        return node.get_text(strip=True) if node else ''
 
@@ -12,9 +12,6 @@
 from urllib.parse import urlparse, urljoin
 from os import devnull
 import sys
-from slimit.parser import Parser
-from slimit.visitors import nodevisitor
-from slimit import ast
 from datetime import datetime
 from sqlalchemy_utils import Currency
 import json
@@ -22,16 +19,32 @@ import unicodedata
 import dateutil.parser
 import re
 import contextlib
+import functools
+
+# Shared by every silence_output() call, rather than reopened each time
+_DEVNULL = open(devnull, 'w')
 
 @contextlib.contextmanager
 def silence_output():
     save_stdout = sys.stdout
     save_stderr = sys.stderr
-    sys.stdout = open(devnull, 'w')
-    sys.stderr = open(devnull, 'w')
-    yield
-    sys.stdout = save_stdout
-    sys.stderr = save_stderr
+    sys.stdout = _DEVNULL
+    sys.stderr = _DEVNULL
+    try:
+        yield
+    finally:
+        sys.stdout = save_stdout
+        sys.stderr = save_stderr
+
+# slimit generates its parse tables on import and on parser construction,
+# so defer both until an auction page is first parsed, and do them only once
+@functools.lru_cache(maxsize=None)
+def _lazy_slimit():
+    with silence_output():
+        from slimit.parser import Parser
+        from slimit import ast
+        parser = Parser()
+    return parser, ast
 
 from auction_scraper.abstract_scraper import AbstractAuctionScraper, \
     SearchResult
@@ -85,11 +98,28 @@ class EbayAuctionScraper(AbstractAuctionScraper):
 
     def __parse_2020_auction_soup(self, soup, duplicates):
         def get_embedded_json():
-            # Strip c from s, without exception
-            def strip(s, c):
-                if isinstance(s, str):
-                    return s.strip(c)
-                return s
+            parser, ast = _lazy_slimit()
+
+            # The value of a literal node.  String tokens keep their
+            # enclosing quotes, so slice them off rather than strip, which
+            # would also eat quotes belonging to the value
+            def literal(node):
+                if isinstance(node, ast.String):
+                    return node.value[1:-1]
+                if isinstance(node, (ast.Identifier, ast.Number, \
+                        ast.Boolean, ast.Null)):
+                    return node.value
+                if isinstance(node, ast.UnaryOp) and not node.postfix and \
+                        isinstance(node.value, ast.Number):
+                    # Minified JS writes true, false and undefined as
+                    # !0, !1 and void 0
+                    if node.op == '!':
+                        return 'true' if node.value.value == '0' else 'false'
+                    if node.op == 'void':
+                        return 'null'
+                    if node.op in ('-', '+'):
+                        return node.op + node.value.value
+                return ''
 
             div = soup.find('div', id='JSDF')
             scripts = div.find_all('script', src=None)
@@ -101,41 +131,47 @@ class EbayAuctionScraper(AbstractAuctionScraper):
                     if '$rwidgets' in s:
                         script_texts.append(s)
 
-            # Bodge until we get rid of slimit
-            with silence_output():
-                parser = Parser()
+            def is_rwidgets_call(node):
+                return isinstance(node, ast.FunctionCall) and \
+                    isinstance(node.identifier, ast.Identifier) and \
+                    node.identifier.value == '$rwidgets'
+
+            # Walk the tree once, collecting the assignments within each
+            # $rwidgets call into fields as they are reached
+            def walk(node, fields):
+                for child in node:
+                    if is_rwidgets_call(child):
+                        call_fields = {}
+                        walk(child, call_fields)
+                        merge(call_fields)
+                        continue
+
+                    if fields is not None and isinstance(child, ast.Assign):
+                        k = literal(child.left)
+                        v = literal(child.right)
+                        if k in duplicates:
+                            try:
+                                fields[k].append(v)
+                            except KeyError:
+                                fields[k] = [v]
+                        else:
+                            fields[k] = v
+                    walk(child, fields)
+
+            # Merge fields and raw_values, resolving duplicates
+            def merge(fields):
+                for (k, v) in fields.items():
+                    if k in duplicates:
+                        try:
+                            raw_values[k] += v
+                        except KeyError:
+                            raw_values[k] = v
+                    elif v != 'null':
+                        raw_values[k] = v
 
             raw_values = {}
             for script_text in script_texts:
-                tree = parser.parse(script_text)
-                # Parsing js
-                for node in nodevisitor.visit(tree):
-                    if isinstance(node, ast.FunctionCall):
-                        if isinstance(node.identifier, ast.Identifier):
-                            if node.identifier.value == '$rwidgets':
-                                # Deal with here
-                                fields = {}
-                                for n in nodevisitor.visit(node):
-                                    if isinstance(n, ast.Assign):
-                                        k = getattr(n.left, 'value', '').strip('"')
-                                        v = strip(getattr(n.right, 'value', ''), '"')
-                                        if k in duplicates:
-                                            try:
-                                                fields[k].append(v)
-                                            except KeyError:
-                                                fields[k] = [v]
-                                        else:
-                                            fields[k] = v
-
-                                # Merge fields and raw_values, resolving duplicates
-                                for (k, v) in fields.items():
-                                    if k in duplicates:
-                                        try:
-                                            raw_values[k] += v
-                                        except KeyError:
-                                            raw_values[k] = v
-                                    elif v != 'null':
-                                        raw_values[k] = v
+                walk(parser.parse(script_text), None)
             return raw_values
 
         def get_image_urls(raw_values):
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from bs4 import BeautifulSoup
+
+from auction_scraper.scrapers.ebay.EbayAuctionScraper import \
+    EbayAuctionScraper, cache
+
+AUCTION_PAGE = r'''
+<html><head>
+<script src="https://ir.ebaystatic.com/rs/v/app.js"></script>
+<script>var unrelated = {"it": "not an auction"};</script>
+<script>
+$rwidgets([["com.ebay.raptor.vi.Item", {"itemId":"123456","it":"Lot of 3 (new); free ship","bids":2,"endTime":"1600000000000","vatIncluded":false}]]);
+$rwidgets([["com.ebay.raptor.vi.Images", {"maxImageUrl":"https://i.ebayimg.com/a/s-l1600.jpg","displayImgUrl":"https://i.ebayimg.com/a/s-l500.jpg","maxImageUrl":null,"displayImgUrl":"https:\u002F\u002Fi.ebayimg.com\u002Fb\u002Fs-l500.jpg","locale":"Say \"hi\""}]]);
+</script>
+</head><body></body></html>
+'''
+
+
+def make_scraper():
+    # Skip __init__, which needs a database; only the parsing is exercised
+    return EbayAuctionScraper.__new__(EbayAuctionScraper)
+
+
+def get_embedded_json(html):
+    soup = BeautifulSoup(html, 'lxml')
+    return make_scraper()._EbayAuctionScraper__get_embedded_json(soup)
+
+
+def test_embedded_json_values():
+    raw_values = get_embedded_json(AUCTION_PAGE)
+    assert raw_values['itemId'] == '123456'
+    assert raw_values['it'] == 'Lot of 3 (new); free ship'
+    assert raw_values['bids'] == 2
+    assert raw_values['vatIncluded'] is False
+    assert raw_values['locale'] == 'Say "hi"'
+
+
+def test_embedded_json_duplicates():
+    raw_values = get_embedded_json(AUCTION_PAGE)
+    assert raw_values['maxImageUrl'] == [
+        'https://i.ebayimg.com/a/s-l1600.jpg', None]
+    assert raw_values['displayImgUrl'] == [
+        'https://i.ebayimg.com/a/s-l500.jpg',
+        'https://i.ebayimg.com/b/s-l500.jpg']
+
+
+def test_embedded_json_ignores_other_scripts():
+    raw_values = get_embedded_json(
+        '<script>var unrelated = {"it": "not an auction"};</script>')
+    assert raw_values == {}
+
+
+def test_embedded_json_keeps_invalid_literals():
+    raw_values = get_embedded_json(
+        r'<script>$rwidgets([{"it":"caf\xe9","qty":0123,"bids":4}]);</script>')
+    assert raw_values['it'] == r'caf\xe9'
+    assert raw_values['qty'] == '0123'
+    assert raw_values['bids'] == 4
+
+
+def test_dict_value_coerces_quoted_scalars():
+    get_dict_value = make_scraper()._EbayAuctionScraper__get_dict_value
+    raw_values = {'bids': '3', 'price': '4.5', 'vat': 'true', 'n': 7}
+    assert get_dict_value(raw_values, 'bids') == 3
+    assert get_dict_value(raw_values, 'price') == 4.5
+    assert get_dict_value(raw_values, 'vat') is True
+    assert get_dict_value(raw_values, 'n') == 7
+    assert get_dict_value(raw_values, 'missing', 1) == 1
+
+
+def scrape_twice(tmp_path, page):
+    """
+    Scrapes page in two runs sharing a disk cache, returning the results
+    and the uris actually fetched.
+    """
+    fetched = []
+    # Start from an empty in-memory cache, which is shared module-wide
+    cache.clear()
+
+    async def get_page(uri):
+        fetched.append(uri)
+        return BeautifulSoup(page, 'lxml'), page
+
+    async def scrape(uri):
+        async with EbayAuctionScraper(str(tmp_path / 'auctions.db'),
+                cache_path=tmp_path / 'cache',
+                cache_size_limit=2**20) as scraper:
+            scraper._get_page = get_page
+            return await scraper._scrape_auction_page(uri)
+
+    uri = 'https://www.ebay.com/itm/123456'
+    results = [asyncio.run(scrape(uri)), asyncio.run(scrape(uri))]
+    return results, fetched
+
+
+def test_ended_auction_persisted_across_runs(tmp_path):
+    pytest.importorskip('diskcache')
+    [(first, first_html), (second, second_html)], fetched = \
+        scrape_twice(tmp_path, AUCTION_PAGE)
+    assert len(fetched) == 1
+    assert second.id == first.id == 123456
+    assert second.title == first.title
+    assert second.end_time == first.end_time
+    assert second_html == first_html == AUCTION_PAGE
+
+
+def test_live_auction_refetched(tmp_path):
+    pytest.importorskip('diskcache')
+    live_page = AUCTION_PAGE.replace('1600000000000', '99999999999999')
+    _, fetched = scrape_twice(tmp_path, live_page)
+    assert len(fetched) == 2